@@ -1,36 +1,44 @@
 from colorama import Fore, Style, init
-from os import system
+from os import environ, system
+import sys
 import time
 from pystyle import Colors
 from datetime import datetime
-from collections.abc import Iterable
+
+# Consoles that can't encode the unicode arrow get an ASCII one instead
+_encoding = getattr(sys.stdout, 'encoding', None) or ''
+ARROW = '\u2794' if 'utf' in _encoding.lower() else '->'
+
+# Colour fragments reused by every log line
+_GRAY = Colors.dark_gray
+_WHITE = Colors.white
+_SEPARATOR = f"{_GRAY} {ARROW} "
+_SUFFIX = f"{_GRAY} {_WHITE}{Style.RESET_ALL}"
+
+# DEBUG entries are dropped unless LOG_LEVEL=DEBUG
+_SHOW_DEBUG = environ.get('LOG_LEVEL', '').upper() == 'DEBUG'
 
 class Logger:
 
     @staticmethod
     def Log(work_done, message, color, **kwargs):
-        timestamp = datetime.fromtimestamp(time.time()).strftime("%H:%M:%S")
-        output_message = f"{Colors.dark_gray}{timestamp} » {color}{work_done} {Colors.dark_gray}•{Colors.white} {message}{Colors.dark_gray} \u2794 "
+        if work_done == 'DEBUG' and not _SHOW_DEBUG:
+            return
+
+        timestamp = time.strftime("%H:%M:%S", time.localtime())
+        parts = [f"{_GRAY}{timestamp} » {color}{work_done} {_GRAY}•{_WHITE} {message}"]
 
         for key, value in kwargs.items():
-            formatted_key = f"{Colors.white}{key}"
+            formatted_key = f"{_WHITE}{key}"
             if isinstance(value, str):
-                formatted_value = f"[{color}{value}{Colors.white}]"
-            elif isinstance(value, Iterable) and not isinstance(value, str):
-                formatted_value = f"[{', '.join([f'{color}{v}{Colors.white}' for v in value])}]"
+                formatted_value = f"[{color}{value}{_WHITE}]"
+            elif isinstance(value, (list, tuple, set)):
+                formatted_value = f"[{', '.join([f'{color}{v}{_WHITE}' for v in value])}]"
             else:
-                formatted_value = f"[{color}{value}{Colors.white}]"
-            output_message += f" {formatted_key} {formatted_value}{Colors.dark_gray} \u2794 "
-
-        output_message = output_message[:-3]
-        output_message += f" {Colors.white}{Style.RESET_ALL}"
-
-        try:
-            print(output_message)
+                formatted_value = f"[{color}{value}{_WHITE}]"
+            parts.append(f" {formatted_key} {formatted_value}")
 
-        except:
-            output_message = output_message.replace('\u2794', '->')
-            print(output_message)
+        print(_SEPARATOR.join(parts) + _SUFFIX)
         
     @staticmethod
     def w_Input(message, **kwargs):
@@ -0,0 +1,102 @@
+"""
+Database Helpers
+Shared SQLite connection setup for the web server and the advertiser
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = 'advertiser.db'
+
+# Prepared statements kept per connection (sqlite3 default is 128)
+STATEMENT_CACHE_SIZE = 256
+
+# Applied to every new connection (journal_mode is set once by the writer)
+CONNECTION_PRAGMAS = '''
+    PRAGMA busy_timeout = 5000;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA cache_size = -20000;
+    PRAGMA foreign_keys = ON;
+'''
+
+
+def connect(readonly: bool = False) -> sqlite3.Connection:
+    """Open a tuned connection that returns sqlite3.Row rows"""
+    if readonly:
+        conn = sqlite3.connect(f'file:{DB_PATH}?mode=ro', uri=True, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+    else:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(CONNECTION_PRAGMAS)
+    return conn
+
+
+def enable_wal(conn: sqlite3.Connection):
+    """Switch the database file to WAL mode (persists across connections)"""
+    conn.execute('PRAGMA journal_mode = WAL')
+
+
+class DbPool:
+    """One serialized writer connection plus a pool of read-only connections"""
+
+    def __init__(self, readers: int = None):
+        self.size = readers or os.cpu_count() or 4
+        self._readers = queue.Queue()
+        self._opened = 0
+        self._open_lock = threading.Lock()
+        self._writer = None
+        # Reentrant so a write helper can be called while already writing
+        self._write_lock = threading.RLock()
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection for SELECTs"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def acquire(self) -> sqlite3.Connection:
+        """Check out a read-only connection; pair with release()"""
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        # Open connections lazily, up to the pool size
+        with self._open_lock:
+            if self._opened < self.size:
+                conn = connect(readonly=True)
+                self._opened += 1
+                return conn
+        return self._readers.get()
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection taken with acquire()"""
+        self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        """Hold the writer connection; commits on success, rolls back on error"""
+        with self._write_lock:
+            if self._writer is None:
+                # WAL is persistent, so switching on the first write
+                # connection covers every later reader too
+                self._writer = connect()
+                enable_wal(self._writer)
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+
+# Global instance
+pool = DbPool()
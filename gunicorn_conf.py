@@ -0,0 +1,25 @@
+"""
+Gunicorn configuration
+Run with: gunicorn -c gunicorn_conf.py web_server_multiuser:app
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Advertisers run on an asyncio loop inside the worker process, so every
+# request for a user must reach the same process: one worker, many threads.
+# (gevent would monkey-patch the thread that hosts that loop.)
+workers = 1
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', (os.cpu_count() or 1) * 4))
+
+keepalive = 5
+timeout = 60
+
+
+def post_worker_init(worker):
+    """Create tables and the first admin once the app is loaded in the worker"""
+    from web_server_multiuser import init_db, ensure_first_admin
+    init_db()
+    ensure_first_admin()
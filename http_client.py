@@ -0,0 +1,33 @@
+"""
+Shared HTTP client
+One pooled aiohttp session reused by every user advertiser
+"""
+
+import aiohttp
+from typing import Optional
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Return the process-wide session, creating it on first use"""
+    global _session
+    if _session is None or _session.closed:
+        # c-ares resolver keeps DNS lookups off the default thread pool
+        connector = aiohttp.TCPConnector(
+            resolver=aiohttp.AsyncResolver(),
+            limit=100,
+            limit_per_host=50,
+            ttl_dns_cache=300,
+            keepalive_timeout=75
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+async def close_session():
+    """Close the shared session and release pooled connections"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -5,11 +5,355 @@ Runs in background thread, sends messages for all users
 
 import asyncio
 import aiohttp
-import sqlite3
-import json
-import random
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+import orjson
+import yarl
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from database import pool
+from http_client import get_session
+
+# Maximum in-flight sends per Discord token
+CONCURRENCY_PER_TOKEN = 4
+
+# Adaptive send pacing per Discord token
+BUCKET_CAPACITY = 2
+BUCKET_RATE = 0.3  # sends per second
+BUCKET_MIN_RATE = 0.05
+BUCKET_MAX_RATE = 1.0
+BUCKET_RATE_STEP = 0.02
+
+# Pause a route once Discord reports this many requests or fewer remaining
+RATE_LIMIT_THRESHOLD = 1
+
+# AIMD bounds for concurrent Discord requests per user
+AIMD_INITIAL_LIMIT = 2
+AIMD_MIN_LIMIT = 1
+AIMD_MAX_LIMIT = 32
+AIMD_INCREASE = 0.5
+AIMD_DECREASE = 0.5
+
+# Activity log batching
+LOG_BATCH_SIZE = 50
+LOG_FLUSH_INTERVAL = 1  # seconds
+LOG_PRUNE_INTERVAL = 60  # seconds
+LOG_RETENTION = 100  # rows kept per user
+
+# How long a user's cached settings are reused before re-reading
+CONFIG_CACHE_TTL = 30  # seconds
+
+# How often accumulated send counts are written to user_stats
+STATS_FLUSH_INTERVAL = 2  # seconds
+
+# Upper bound on how long stop_user_advertiser waits for the task to exit
+STOP_TIMEOUT = 5  # seconds
+
+# Periodic database upkeep
+MAINTENANCE_INTERVAL = 24 * 60 * 60  # seconds
+LOG_MAX_AGE_DAYS = 30
+VACUUM_FREE_RATIO = 0.25  # rebuild once this share of pages is unused
+
+
+def utc_today() -> str:
+    """Today's date in UTC, the clock activity_logs and user_stats timestamps are written in"""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+class LogBuffer:
+    """Buffers activity log rows and writes them in batches"""
+    
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.task: Optional[asyncio.Task] = None
+        self._pending = []
+        self._has_pending: Optional[asyncio.Event] = None
+        self._dirty_users = set()
+        self._last_prune = time.monotonic()
+    
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Start the background flush task on the given loop"""
+        self.loop = loop
+        self._has_pending = asyncio.Event()
+        self.task = loop.create_task(self.run())
+    
+    def add(self, user_id: int, level: str, message: str, details: Optional[str] = None):
+        """Queue a log row; safe to call from any thread"""
+        # Stamp now in CURRENT_TIMESTAMP format so batching doesn't skew times
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        row = (user_id, level, message, details, timestamp)
+        
+        if self.loop is None:
+            self._write([row])
+        else:
+            self.loop.call_soon_threadsafe(self._append, row)
+    
+    def _append(self, row: tuple):
+        self._pending.append(row)
+        self._has_pending.set()
+    
+    async def run(self):
+        """Flush pending rows once per interval, or sooner when a batch fills up"""
+        while True:
+            await self._has_pending.wait()
+            if len(self._pending) < LOG_BATCH_SIZE:
+                await asyncio.sleep(LOG_FLUSH_INTERVAL)
+            await self.flush()
+    
+    async def flush(self):
+        """Write all pending rows in one transaction"""
+        batch, self._pending = self._pending, []
+        if self._has_pending:
+            self._has_pending.clear()
+        if batch:
+            await asyncio.to_thread(self._write, batch)
+            self._dirty_users.update(row[0] for row in batch)
+        
+        if self._dirty_users and time.monotonic() - self._last_prune >= LOG_PRUNE_INTERVAL:
+            users, self._dirty_users = self._dirty_users, set()
+            self._last_prune = time.monotonic()
+            await asyncio.to_thread(self._prune, users)
+    
+    def _write(self, batch: list):
+        try:
+            with pool.writer() as conn:
+                # Skip rows for users deleted since queueing, so one stale row can't roll back the batch
+                conn.executemany(
+                    '''INSERT INTO activity_logs (user_id, level, message, details, timestamp)
+                       SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM users WHERE id = ?)''',
+                    [row + (row[0],) for row in batch]
+                )
+        except Exception as e:
+            print(f"Log error: {e}")
+    
+    def _prune(self, users: set):
+        """Keep only the newest LOG_RETENTION rows for each user"""
+        try:
+            with pool.writer() as conn:
+                conn.executemany(
+                    '''DELETE FROM activity_logs WHERE user_id = ? AND id <= (
+                        SELECT id FROM activity_logs WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+                    )''',
+                    [(user_id, user_id, LOG_RETENTION) for user_id in users]
+                )
+        except Exception as e:
+            print(f"Log prune error: {e}")
+
+
+log_buffer = LogBuffer()
+
+
+class StatsBuffer:
+    """Accumulates per-user send counts and writes them in one batch"""
+    
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, int] = {}
+    
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Start the background flush task on the given loop"""
+        self.loop = loop
+        self.task = loop.create_task(self.run())
+    
+    def add(self, user_id: int, messages_sent: int = 0):
+        """Count sends for a user and bump last_activity; safe from any thread"""
+        if self.loop is None:
+            self._write([(messages_sent, user_id)])
+        else:
+            self.loop.call_soon_threadsafe(self._add, user_id, messages_sent)
+    
+    def _add(self, user_id: int, messages_sent: int):
+        self._pending[user_id] = self._pending.get(user_id, 0) + messages_sent
+    
+    async def run(self):
+        while True:
+            await asyncio.sleep(STATS_FLUSH_INTERVAL)
+            await self.flush()
+    
+    async def flush(self):
+        """Write all accumulated counts in one transaction"""
+        batch, self._pending = self._pending, {}
+        if batch:
+            await asyncio.to_thread(self._write, [(sent, user_id) for user_id, sent in batch.items()])
+    
+    def _write(self, rows: list):
+        try:
+            with pool.writer() as conn:
+                conn.executemany(
+                    'UPDATE user_stats SET total_sent = total_sent + ?, last_activity = CURRENT_TIMESTAMP WHERE user_id = ?',
+                    rows
+                )
+        except Exception as e:
+            print(f"Stats update error: {e}")
+
+
+stats_buffer = StatsBuffer()
+
+
+class DatabaseMaintenance:
+    """Ages out old logs and keeps the database and WAL files compact"""
+    
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+    
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Start the periodic maintenance task on the given loop"""
+        self.task = loop.create_task(self.run())
+    
+    async def run(self):
+        while True:
+            await asyncio.sleep(MAINTENANCE_INTERVAL)
+            await asyncio.to_thread(self.run_once)
+    
+    def run_once(self):
+        try:
+            with pool.writer() as conn:
+                conn.execute("DELETE FROM activity_logs WHERE timestamp < datetime('now', ?)",
+                             (f'-{LOG_MAX_AGE_DAYS} days',))
+            
+            # VACUUM can't run inside a transaction, so it gets its own block
+            with pool.writer() as conn:
+                free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                total_pages = conn.execute('PRAGMA page_count').fetchone()[0]
+                if total_pages and free_pages / total_pages >= VACUUM_FREE_RATIO:
+                    conn.execute('VACUUM')
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        except Exception as e:
+            print(f"Database maintenance error: {e}")
+
+
+db_maintenance = DatabaseMaintenance()
+
+
+@dataclass
+class UserSnapshot:
+    """Settings a user's advertiser needs for one cycle"""
+    message: str
+    interval_minutes: int
+    tokens: List[str]
+    channels: List[Tuple[int, str]]  # (token_index, channel_id)
+
+
+class UserConfigCache:
+    """Caches per-user advertiser settings for a short TTL"""
+    
+    def __init__(self, ttl: float = CONFIG_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[UserSnapshot, float]] = {}
+        # Bumped by invalidate() so a load that raced a settings change isn't cached
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+    
+    def get_snapshot(self, user_id: int) -> UserSnapshot:
+        """Return the cached snapshot, re-reading the database when stale"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            generation = self._generations.get(user_id, 0)
+        if entry and time.monotonic() - entry[1] < self.ttl:
+            return entry[0]
+        
+        snapshot = self._load(user_id)
+        with self._lock:
+            if self._generations.get(user_id, 0) == generation:
+                self._entries[user_id] = (snapshot, time.monotonic())
+        return snapshot
+    
+    def invalidate(self, user_id: int):
+        """Drop a user's snapshot after their settings change"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+    
+    def _load(self, user_id: int) -> UserSnapshot:
+        with pool.reader() as conn:
+            config = conn.execute('SELECT advertisement_message, interval_minutes FROM user_configs WHERE user_id = ?',
+                                  (user_id,)).fetchone()
+            tokens = conn.execute('SELECT token FROM user_tokens WHERE user_id = ?', (user_id,)).fetchall()
+            channels = conn.execute('SELECT token_index, channel_id FROM user_channels WHERE user_id = ?',
+                                    (user_id,)).fetchall()
+        
+        return UserSnapshot(
+            message=(config['advertisement_message'] if config else None) or '',
+            interval_minutes=config['interval_minutes'] if config else 60,
+            tokens=[row['token'] for row in tokens],
+            channels=[(row['token_index'], row['channel_id']) for row in channels]
+        )
+
+
+config_cache = UserConfigCache()
+
+
+class TokenBucket:
+    """Adaptive token bucket that paces sends for one Discord token"""
+    
+    def __init__(self, capacity: float = BUCKET_CAPACITY, rate: float = BUCKET_RATE):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        # last_refill may lie in the future while a 429 penalty is pending
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+    
+    def next_available(self) -> float:
+        """Seconds until the next send is allowed"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+    
+    async def acquire(self):
+        """Wait until a send is allowed and consume it"""
+        while True:
+            wait = self.next_available()
+            if wait <= 0:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(wait)
+    
+    def increase(self):
+        """Speed up slightly after a successful send"""
+        self.rate = min(BUCKET_MAX_RATE, self.rate + BUCKET_RATE_STEP)
+    
+    def decrease(self, retry_after: float):
+        """Halve the rate and hold all sends until Discord's retry_after passes"""
+        self._refill()
+        self.rate = max(BUCKET_MIN_RATE, self.rate / 2)
+        self.tokens = 0
+        self.last_refill = time.monotonic() + retry_after
+
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease"""
+    
+    def __init__(self, limit: float = AIMD_INITIAL_LIMIT):
+        self.limit = limit
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+    
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+    
+    def on_success(self):
+        self.limit = min(AIMD_MAX_LIMIT, self.limit + AIMD_INCREASE)
+    
+    def on_error(self):
+        self.limit = max(AIMD_MIN_LIMIT, self.limit * AIMD_DECREASE)
+
 
 class UserAdvertiser:
     """Handles advertising for a single user"""
@@ -21,58 +365,115 @@ class UserAdvertiser:
         self.active_tokens = 0
         self.channels_tracked = 0
         self.last_send = None
-        
-    def get_db(self):
-        conn = sqlite3.connect('advertiser.db')
-        conn.row_factory = sqlite3.Row
-        return conn
+        # Sends counted in memory so status polls never touch the database
+        self.messages_today = 0
+        self._today = None
+        self.buckets: Dict[str, TokenBucket] = {}
+        # Discord's X-RateLimit-* state: bucket key -> (remaining, reset_at)
+        self.bucket_state: Dict[tuple, Tuple[int, float]] = {}
+        self._route_buckets: Dict[Tuple[str, str], tuple] = {}
+        self.limiter = AIMDLimiter()
+        self._stop = asyncio.Event()
+        # Per-token request headers and the last encoded message body
+        self._headers_cache: Dict[str, dict] = {}
+        self._url_cache: Dict[str, yarl.URL] = {}
+        self._payload: Tuple[str, bytes] = ('', b'')
     
     def add_log(self, level: str, message: str):
-        """Add log entry to database"""
-        try:
-            conn = self.get_db()
-            conn.execute(
-                'INSERT INTO activity_logs (user_id, level, message) VALUES (?, ?, ?)',
-                (self.user_id, level, message)
-            )
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(f"Log error: {e}")
+        """Queue a log entry for the next batched write"""
+        log_buffer.add(self.user_id, level, message)
     
     def update_stats(self, messages_sent: int = 0):
-        """Update user statistics"""
-        try:
-            conn = self.get_db()
-            conn.execute(
-                'UPDATE user_stats SET total_sent = total_sent + ?, last_activity = ? WHERE user_id = ?',
-                (messages_sent, datetime.now().isoformat(), self.user_id)
-            )
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(f"Stats update error: {e}")
+        """Queue a stats update for the next batched write"""
+        stats_buffer.add(self.user_id, messages_sent)
+    
+    def _load_sent_today(self) -> int:
+        with pool.reader() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) as count FROM activity_logs WHERE user_id = ? AND level = 'SUCCESS' AND timestamp LIKE ?",
+                (self.user_id, f'{self._today}%')
+            ).fetchone()
+        return row['count'] if row else 0
+    
+    def count_sent(self, count: int = 1):
+        """Add to today's send counter, resetting it when the UTC date rolls over"""
+        today = utc_today()
+        if today != self._today:
+            self._today = today
+            self.messages_today = 0
+        self.messages_today += count
+    
+    def get_messages_today(self) -> int:
+        """Sends so far today, without a database round-trip"""
+        if self._today != utc_today():
+            return 0
+        return self.messages_today
+    
+    def get_bucket(self, token: str) -> TokenBucket:
+        """Return the pacing bucket for a token, creating it on first use"""
+        bucket = self.buckets.get(token)
+        if bucket is None:
+            bucket = self.buckets[token] = TokenBucket()
+        return bucket
+    
+    def record_rate_limit(self, token: str, channel_id: str, headers):
+        """Remember the rate limit Discord reported for this token and channel"""
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_after = headers.get('X-RateLimit-Reset-After')
+        if remaining is None or reset_after is None:
+            return
+        
+        # Buckets are shared per token and scoped by the channel (major parameter)
+        bucket_key = (token, headers.get('X-RateLimit-Bucket'), channel_id)
+        self._route_buckets[(token, channel_id)] = bucket_key
+        self.bucket_state[bucket_key] = (int(remaining), time.monotonic() + float(reset_after))
+    
+    async def wait_for_rate_limit(self, token: str, channel_id: str):
+        """Sleep until the route's bucket resets if it is nearly exhausted"""
+        bucket_key = self._route_buckets.get((token, channel_id))
+        state = self.bucket_state.get(bucket_key) if bucket_key else None
+        if not state:
+            return
+        
+        remaining, reset_at = state
+        delay = reset_at - time.monotonic()
+        if remaining <= RATE_LIMIT_THRESHOLD and delay > 0:
+            await asyncio.sleep(delay)
     
     async def send_message(self, session: aiohttp.ClientSession, token: str, channel_id: str, message: str) -> bool:
         """Send a message to a Discord channel"""
-        url = f"https://discord.com/api/v9/channels/{channel_id}/messages"
-        headers = {
-            "Authorization": token,
-            "Content-Type": "application/json",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        }
-        payload = {"content": message}
+        # Parsed once per channel; aiohttp uses URL objects as-is
+        url = self._url_cache.get(channel_id)
+        if url is None:
+            url = self._url_cache[channel_id] = yarl.URL(f"https://discord.com/api/v9/channels/{channel_id}/messages")
+        headers = self._headers_cache.get(token)
+        if headers is None:
+            headers = self._headers_cache[token] = {
+                "Authorization": token,
+                "Content-Type": "application/json",
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+            }
+        
+        # Re-encode only when the message changes
+        if self._payload[0] != message:
+            self._payload = (message, orjson.dumps({"content": message}))
+        body = self._payload[1]
         
         try:
-            async with session.post(url, headers=headers, json=payload) as response:
+            await self.wait_for_rate_limit(token, channel_id)
+            async with self.limiter, session.post(url, headers=headers, data=body) as response:
+                self.record_rate_limit(token, channel_id, response.headers)
                 if response.status == 200:
+                    self.limiter.on_success()
+                    self.get_bucket(token).increase()
                     return True
                 elif response.status == 429:
-                    # Rate limited
-                    data = await response.json()
+                    # Rate limited - back off this token's bucket
+                    self.limiter.on_error()
+                    data = orjson.loads(await response.read())
                     retry_after = data.get('retry_after', 5)
                     self.add_log('WARNING', f'Rate limited on channel {channel_id}, waiting {retry_after}s')
-                    await asyncio.sleep(retry_after)
+                    self.get_bucket(token).decrease(retry_after)
                     return False
                 elif response.status == 401:
                     self.add_log('ERROR', f'Invalid token for channel {channel_id}')
@@ -81,79 +482,101 @@ class UserAdvertiser:
                     self.add_log('WARNING', f'No permission to send in channel {channel_id}')
                     return False
                 else:
+                    if response.status >= 500:
+                        self.limiter.on_error()
                     self.add_log('ERROR', f'Failed to send to {channel_id}: Status {response.status}')
                     return False
         except Exception as e:
+            self.limiter.on_error()
             self.add_log('ERROR', f'Network error sending to {channel_id}: {str(e)}')
             return False
     
+    async def get_snapshot(self) -> UserSnapshot:
+        """Fetch this user's settings from the cache off the event loop"""
+        return await asyncio.to_thread(config_cache.get_snapshot, self.user_id)
+    
     async def run_cycle(self):
         """Run one advertising cycle"""
-        conn = self.get_db()
+        snapshot = await self.get_snapshot()
+        message = snapshot.message
+        tokens = snapshot.tokens
+        channels = snapshot.channels
         
-        # Get user config
-        config = conn.execute('SELECT * FROM user_configs WHERE user_id = ?', (self.user_id,)).fetchone()
-        if not config or not config['advertisement_message']:
-            conn.close()
+        if not message:
             self.add_log('WARNING', 'No advertisement message configured')
             return 0
         
-        message = config['advertisement_message']
-        
-        # Get tokens
-        tokens = conn.execute('SELECT token FROM user_tokens WHERE user_id = ?', (self.user_id,)).fetchall()
         if not tokens:
-            conn.close()
             self.add_log('WARNING', 'No tokens configured')
             return 0
         
-        # Get channels
-        channels = conn.execute('SELECT * FROM user_channels WHERE user_id = ?', (self.user_id,)).fetchall()
         if not channels:
-            conn.close()
             self.add_log('WARNING', 'No channels configured')
             return 0
         
-        conn.close()
-        
         self.active_tokens = len(tokens)
         self.channels_tracked = len(channels)
         
+        # Group channels by the token that sends to them
+        channels_by_token: Dict[int, list] = {}
+        for token_index, channel_id in channels:
+            if token_index >= len(tokens):
+                token_index = 0
+            channels_by_token.setdefault(token_index, []).append(channel_id)
+        
+        session = await get_session()
+        
+        # Each token drains its own channels concurrently with the others
+        results = await asyncio.gather(
+            *[self.token_worker(session, tokens[token_index], channel_ids, message)
+              for token_index, channel_ids in channels_by_token.items()],
+            return_exceptions=True
+        )
+        
         messages_sent = 0
+        for result in results:
+            if isinstance(result, Exception):
+                self.add_log('ERROR', f'Token worker error: {str(result)}')
+            else:
+                messages_sent += result
         
-        async with aiohttp.ClientSession() as session:
-            for channel in channels:
-                token_index = channel['token_index']
-                if token_index >= len(tokens):
-                    token_index = 0
-                
-                token = tokens[token_index]['token']
-                channel_id = channel['channel_id']
-                
+        return messages_sent
+    
+    async def token_worker(self, session: aiohttp.ClientSession, token: str, channel_ids: list, message: str) -> int:
+        """Send the message to every channel assigned to one token"""
+        semaphore = asyncio.Semaphore(CONCURRENCY_PER_TOKEN)
+        bucket = self.get_bucket(token)
+        
+        async def send(channel_id: str) -> bool:
+            async with semaphore:
+                # The token's bucket paces sends in place of a fixed delay
+                await bucket.acquire()
                 success = await self.send_message(session, token, channel_id, message)
                 if success:
-                    messages_sent += 1
+                    self.count_sent()
                     self.add_log('SUCCESS', f'Sent message to channel {channel_id}')
-                
-                # Random delay between messages (2-5 seconds)
-                await asyncio.sleep(random.uniform(2, 5))
+                return success
         
-        return messages_sent
+        results = await asyncio.gather(*[send(channel_id) for channel_id in channel_ids])
+        return sum(results)
     
     async def run(self):
         """Main advertising loop"""
         self.running = True
         self.add_log('INFO', 'Advertiser started')
         
+        # Seed today's counter once; later sends are counted in memory
+        try:
+            self._today = utc_today()
+            self.messages_today = await asyncio.to_thread(self._load_sent_today)
+        except Exception as e:
+            self.add_log('ERROR', f'Failed to load stats: {str(e)}')
+        
         while self.running:
             try:
                 # Get interval from config
-                conn = self.get_db()
-                config = conn.execute('SELECT interval_minutes FROM user_configs WHERE user_id = ?', 
-                                     (self.user_id,)).fetchone()
-                conn.close()
-                
-                interval = (config['interval_minutes'] if config else 60) * 60  # Convert to seconds
+                snapshot = await self.get_snapshot()
+                interval = snapshot.interval_minutes * 60  # Convert to seconds
                 
                 # Run advertising cycle
                 messages_sent = await self.run_cycle()
@@ -167,11 +590,11 @@ class UserAdvertiser:
                 # Wait for next cycle
                 self.add_log('INFO', f'Waiting {interval // 60} minutes until next cycle')
                 
-                # Check every 10 seconds if we should stop
-                for _ in range(interval // 10):
-                    if not self.running:
-                        break
-                    await asyncio.sleep(10)
+                # Sleep until the next cycle, waking immediately on stop()
+                try:
+                    await asyncio.wait_for(self._stop.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
                     
             except asyncio.CancelledError:
                 break
@@ -184,6 +607,7 @@ class UserAdvertiser:
     def stop(self):
         """Stop the advertiser"""
         self.running = False
+        self._stop.set()
         if self.task:
             self.task.cancel()
 
@@ -222,16 +646,17 @@ class AdvertiserService:
         """Stop advertiser for a user"""
         if user_id in self.user_advertisers:
             advertiser = self.user_advertisers[user_id]
+            # stop() already cancels the task; cancelling twice would also
+            # abort the final "stopped" log write
             advertiser.stop()
             
+            # Return as soon as the task has exited instead of a fixed sleep
             if advertiser.task:
-                try:
-                    advertiser.task.cancel()
-                    await asyncio.sleep(0.1)
-                except:
-                    pass
+                await asyncio.wait([advertiser.task], timeout=STOP_TIMEOUT)
             
-            del self.user_advertisers[user_id]
+            # An overlapping stop or a restart may have replaced the entry while we waited
+            if self.user_advertisers.get(user_id) is advertiser:
+                del self.user_advertisers[user_id]
     
     def get_user_status(self, user_id: int) -> dict:
         """Get status of user's advertiser"""
@@ -241,7 +666,8 @@ class AdvertiserService:
                 'running': advertiser.running,
                 'active_tokens': advertiser.active_tokens,
                 'channels_tracked': advertiser.channels_tracked,
-                'last_send': advertiser.last_send.isoformat() if advertiser.last_send else None
+                'last_send': advertiser.last_send.isoformat() if advertiser.last_send else None,
+                'messages_today': advertiser.get_messages_today()
             }
         return {
             'running': False,
@@ -250,6 +676,13 @@ class AdvertiserService:
             'last_send': None
         }
     
+    def get_all_statuses(self) -> Dict[int, dict]:
+        """Running state and active tokens for every user with an advertiser"""
+        return {
+            user_id: {'running': advertiser.running, 'active_tokens': advertiser.active_tokens}
+            for user_id, advertiser in list(self.user_advertisers.items())
+        }
+    
     def is_user_running(self, user_id: int) -> bool:
         """Check if user's advertiser is running"""
         return user_id in self.user_advertisers and self.user_advertisers[user_id].running
@@ -1,23 +1,43 @@
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for
+from flask import Flask, Response, abort, g, render_template, jsonify, make_response, request, session, redirect, url_for
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-import json
+from flask_compress import Compress
+from werkzeug.security import check_password_hash
+import bcrypt
+import orjson
 import os
-from datetime import datetime, timedelta
+import re
+from datetime import datetime, timedelta, timezone
 import secrets
 import sqlite3
 from functools import wraps
 import asyncio
 import threading
 import sys
+import time
 import platform
+import atexit
 
 # Import advertiser service
-from integrated_advertiser import advertiser_service
+from integrated_advertiser import advertiser_service, config_cache, db_maintenance, log_buffer, stats_buffer, utc_today
+from http_client import close_session
+from database import DB_PATH, pool
+
+class OrjsonProvider(JSONProvider):
+    """Serve jsonify() and request.json through orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
+app.json = OrjsonProvider(app)
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
 CORS(app)
+# gzip/brotli JSON and HTML responses above Flask-Compress's 500 byte threshold
+Compress(app)
 
 # Session configuration - 30 day cookies
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
@@ -25,6 +45,54 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['SESSION_COOKIE_SECURE'] = False
 
+# bcrypt work factor for new password hashes
+BCRYPT_ROUNDS = 10
+
+# How long /api/auth/current reuses a user's profile row
+USER_CACHE_TTL = 60  # seconds
+
+# How long /api/config reuses a user's settings and counts
+CONFIG_CACHE_TTL = 30  # seconds
+
+# How long dashboard polls reuse /api/stats and admin overview aggregates
+STATS_CACHE_TTL = 5  # seconds
+OVERVIEW_CACHE_TTL = 15  # seconds
+
+# Upper bounds on what one save request may submit
+MAX_TOKENS = 1000
+MAX_PROXIES = 1000
+
+# Most rows the admin activity feed returns per request
+MAX_ACTIVITY_LIMIT = 500
+
+# Discord tokens are base64url segments joined by dots
+TOKEN_RE = re.compile(r'[A-Za-z0-9_.-]{21,200}')
+
+# Flask-Compress appends ":<encoding>" to ETags it compresses, which clients echo back
+ETAG_ENCODING_RE = re.compile(r':(?:br|gzip|deflate)"')
+
+# Interpreter and OS details don't change while the process runs
+SYSTEM_INFO = {
+    'python_version': sys.version.split()[0],
+    'platform': platform.system(),
+    'platform_release': platform.release()
+}
+
+# Constant response bodies, serialized once
+LOGOUT_BODY = orjson.dumps({'success': True, 'message': 'Logged out successfully'})
+
+# Partial config update: a NULL parameter keeps the column's current value
+UPDATE_CONFIG_SQL = '''
+    UPDATE user_configs SET
+        advertisement_message = COALESCE(?, advertisement_message),
+        interval_minutes = COALESCE(?, interval_minutes),
+        default_cooldown = COALESCE(?, default_cooldown),
+        use_proxies = COALESCE(?, use_proxies),
+        keep_tokens_online = COALESCE(?, keep_tokens_online),
+        online_status = COALESCE(?, online_status)
+    WHERE user_id = ?
+'''
+
 # ============================================================================
 # ADVERTISER SERVICE STARTUP
 # ============================================================================
@@ -40,6 +108,9 @@ def start_advertiser_service():
         global advertiser_loop
         advertiser_loop = asyncio.new_event_loop()
         asyncio.set_event_loop(advertiser_loop)
+        log_buffer.start(advertiser_loop)
+        stats_buffer.start(advertiser_loop)
+        db_maintenance.start(advertiser_loop)
         advertiser_loop.run_forever()
     
     advertiser_thread = threading.Thread(target=run_loop, daemon=True)
@@ -56,104 +127,192 @@ def run_async(coro):
         return future.result(timeout=30)
     return None
 
+def submit_async(coro):
+    """Schedule an async function on the advertiser loop without waiting for it"""
+    if advertiser_loop:
+        future = asyncio.run_coroutine_threadsafe(coro, advertiser_loop)
+        future.add_done_callback(_report_async_error)
+        return future
+    return None
+
+def _report_async_error(future):
+    if not future.cancelled() and future.exception():
+        print(f"Background task error: {future.exception()}")
+
+@atexit.register
+def shutdown_http_session():
+    """Flush buffered logs and stats and close the shared Discord HTTP session on exit"""
+    try:
+        run_async(log_buffer.flush())
+        run_async(stats_buffer.flush())
+        run_async(close_session())
+    except Exception:
+        pass
+
 # ============================================================================
 # DATABASE INITIALIZATION
 # ============================================================================
 
-def init_db():
-    conn = sqlite3.connect('advertiser.db')
-    c = conn.cursor()
-    
-    # Users table
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        is_admin BOOLEAN DEFAULT 0
-    )''')
-    
-    # User configs table
-    c.execute('''CREATE TABLE IF NOT EXISTS user_configs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        advertisement_message TEXT,
-        interval_minutes INTEGER DEFAULT 60,
-        default_cooldown INTEGER DEFAULT 60,
-        use_proxies BOOLEAN DEFAULT 1,
-        keep_tokens_online BOOLEAN DEFAULT 1,
-        online_status TEXT DEFAULT 'online',
-        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )''')
-    
-    # User tokens table
-    c.execute('''CREATE TABLE IF NOT EXISTS user_tokens (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        token TEXT NOT NULL,
-        masked_token TEXT,
-        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )''')
-    
-    # User proxies table
-    c.execute('''CREATE TABLE IF NOT EXISTS user_proxies (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        proxy TEXT NOT NULL,
-        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )''')
-    
-    # User channels table
-    c.execute('''CREATE TABLE IF NOT EXISTS user_channels (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        token_index INTEGER NOT NULL,
-        channel_id TEXT NOT NULL,
-        cooldown_minutes INTEGER DEFAULT 60,
-        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )''')
-    
-    # User servers table
-    c.execute('''CREATE TABLE IF NOT EXISTS user_servers (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        server_id TEXT NOT NULL,
-        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )''')
-    
-    # User stats table
-    c.execute('''CREATE TABLE IF NOT EXISTS user_stats (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        total_sent INTEGER DEFAULT 0,
-        last_activity TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )''')
-    
-    # Activity logs table
-    c.execute('''CREATE TABLE IF NOT EXISTS activity_logs (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        level TEXT NOT NULL,
-        message TEXT NOT NULL,
-        details TEXT,
-        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )''')
-    
-    conn.commit()
-    conn.close()
-
-# Database helper functions
 def get_db():
-    conn = sqlite3.connect('advertiser.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Read-only connection borrowed from the pool for the rest of the request"""
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+def conditional(response):
+    """Tag a polled GET response with an ETag and answer 304 when the client's copy matches"""
+    response.add_etag()
+    # Always revalidate so a poll right after a save never shows the browser's stale copy
+    response.headers['Cache-Control'] = 'no-cache'
+    environ = request.environ
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        environ = dict(environ, HTTP_IF_NONE_MATCH=ETAG_ENCODING_RE.sub('"', if_none_match))
+    return response.make_conditional(environ)
+
+def fetch_tuples(sql, params=()):
+    """Run a query on the request's connection and iterate plain tuples rather than sqlite3.Row"""
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    return cursor.execute(sql, params)
+
+def fetch_column(sql, params):
+    """First column of every row"""
+    return [row[0] for row in fetch_tuples(sql, params)]
+
+# Bump whenever init_db's tables or indexes change
+SCHEMA_VERSION = 3
+
+def init_db():
+    with pool.writer() as conn:
+        # Warm start: the schema below is already in place
+        if conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION:
+            return
+        
+        c = conn.cursor()
+        
+        # Users table
+        c.execute('''CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_admin BOOLEAN DEFAULT 0
+        )''')
+        
+        # User configs table
+        c.execute('''CREATE TABLE IF NOT EXISTS user_configs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            advertisement_message TEXT,
+            interval_minutes INTEGER DEFAULT 60,
+            default_cooldown INTEGER DEFAULT 60,
+            use_proxies BOOLEAN DEFAULT 1,
+            keep_tokens_online BOOLEAN DEFAULT 1,
+            online_status TEXT DEFAULT 'online',
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )''')
+        
+        # User tokens table
+        c.execute('''CREATE TABLE IF NOT EXISTS user_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token TEXT NOT NULL,
+            masked_token TEXT,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )''')
+        
+        # User proxies table
+        c.execute('''CREATE TABLE IF NOT EXISTS user_proxies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            proxy TEXT NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )''')
+        
+        # User channels table
+        c.execute('''CREATE TABLE IF NOT EXISTS user_channels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token_index INTEGER NOT NULL,
+            channel_id TEXT NOT NULL,
+            cooldown_minutes INTEGER DEFAULT 60,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )''')
+        
+        # User servers table
+        c.execute('''CREATE TABLE IF NOT EXISTS user_servers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            server_id TEXT NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )''')
+        
+        # User stats table
+        c.execute('''CREATE TABLE IF NOT EXISTS user_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            total_sent INTEGER DEFAULT 0,
+            last_activity TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )''')
+        
+        # Activity logs table
+        c.execute('''CREATE TABLE IF NOT EXISTS activity_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            level TEXT NOT NULL,
+            message TEXT NOT NULL,
+            details TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )''')
+        
+        # Per-user lookup indexes
+        c.execute('CREATE INDEX IF NOT EXISTS idx_tokens_user ON user_tokens(user_id)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_proxies_user ON user_proxies(user_id)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_logs_user_ts ON activity_logs(user_id, timestamp DESC)')
+        # Admin activity feed and age-based log cleanup scan by time across users
+        c.execute('CREATE INDEX IF NOT EXISTS idx_logs_ts ON activity_logs(timestamp DESC)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_stats_user ON user_stats(user_id)')
+        
+        # One config row per user (keeps the earliest if duplicates crept in)
+        c.execute('''DELETE FROM user_configs WHERE id NOT IN (
+            SELECT MIN(id) FROM user_configs GROUP BY user_id
+        )''')
+        c.execute('DROP INDEX IF EXISTS idx_configs_user')
+        c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_configs_user_unique ON user_configs(user_id)')
+        
+        # One row per channel per token; also serves user_id lookups, so it
+        # replaces the plain user_id index. Drop any old duplicates first.
+        c.execute('''DELETE FROM user_channels WHERE id NOT IN (
+            SELECT MIN(id) FROM user_channels GROUP BY user_id, token_index, channel_id
+        )''')
+        c.execute('DROP INDEX IF EXISTS idx_channels_user')
+        c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_channels_user_token ON user_channels(user_id, token_index, channel_id)')
+        
+        # Same for servers: one row per server per user
+        c.execute('''DELETE FROM user_servers WHERE id NOT IN (
+            SELECT MIN(id) FROM user_servers GROUP BY user_id, server_id
+        )''')
+        c.execute('DROP INDEX IF EXISTS idx_servers_user')
+        c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_servers_user_server ON user_servers(user_id, server_id)')
+    
+    # Refresh planner statistics
+    with pool.writer() as conn:
+        conn.execute('ANALYZE')
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
 
 # ============================================================================
 # AUTHENTICATION DECORATORS
@@ -167,12 +326,20 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def account_gone():
+    """The session's user no longer exists: drop the cookie and ask for a fresh login"""
+    session.clear()
+    return jsonify({'error': 'Authentication required', 'redirect': '/login'}), 401
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
             return jsonify({'error': 'Authentication required'}), 401
-        if not session.get('is_admin'):
+        # Read live rather than from _user_cache so revoking admin or deleting
+        # the user takes effect on the next request, however the row changed
+        user = get_db().execute('SELECT is_admin FROM users WHERE id = ?', (session['user_id'],)).fetchone()
+        if not user or not user['is_admin']:
             return jsonify({'error': 'Admin access required'}), 403
         return f(*args, **kwargs)
     return decorated_function
@@ -186,71 +353,151 @@ def mask_token(token):
         return f"{token[:10]}...{token[-10:]}"
     return "***"
 
+def hash_password(password):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(BCRYPT_ROUNDS)).decode()
+
+def verify_password(stored_hash, password):
+    """Check a password against a bcrypt hash or a legacy werkzeug hash"""
+    if stored_hash.startswith('$2'):
+        return bcrypt.checkpw(password.encode(), stored_hash.encode())
+    return check_password_hash(stored_hash, password)
+
+def bad_request(message):
+    """Abort the current request with a 400 and the usual success/message body"""
+    abort(make_response(jsonify({'success': False, 'message': message}), 400))
+
+def json_body():
+    """The request's JSON object; anything else (missing, malformed, a list or scalar) is a 400"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        bad_request('Request body must be a JSON object')
+    return data
+
+def to_int(value, name):
+    """Coerce a request field to int, answering 400 instead of raising"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        bad_request(f'{name} must be a whole number')
+
+def str_field(data, key):
+    """A string request field, '' when absent; any other type is a 400"""
+    value = data.get(key, '')
+    if not isinstance(value, str):
+        bad_request(f'{key.capitalize()} must be a string')
+    return value
+
+# user_id -> (profile dict, cached_at)
+_user_cache = {}
+
+# user_id -> invalidate_user count, so a lookup that raced an invalidate isn't stored
+_user_generations = {}
+_user_lock = threading.Lock()
+
+def get_user_profile(user_id):
+    """Return a user's id, username, email and is_admin, cached for USER_CACHE_TTL"""
+    entry = _user_cache.get(user_id)
+    if entry and time.monotonic() - entry[1] < USER_CACHE_TTL:
+        return entry[0]
+    
+    generation = _user_generations.get(user_id, 0)
+    user = get_db().execute('SELECT id, username, email, is_admin FROM users WHERE id = ?',
+                            (user_id,)).fetchone()
+    if not user:
+        return None
+    
+    uid, username, email, is_admin = user
+    profile = {'id': uid, 'username': username, 'email': email, 'is_admin': is_admin}
+    with _user_lock:
+        if _user_generations.get(user_id, 0) == generation:
+            _user_cache[user_id] = (profile, time.monotonic())
+    return profile
+
+def invalidate_user(user_id):
+    """Forget a cached profile after the user row changes"""
+    with _user_lock:
+        _user_generations[user_id] = _user_generations.get(user_id, 0) + 1
+        _user_cache.pop(user_id, None)
+
+# user_id -> (/api/config payload, cached_at)
+_config_cache = {}
+
+# user_id -> (/api/stats row, cached_at)
+_stats_cache = {}
+
+# 'totals' -> (admin overview aggregates, cached_at)
+_overview_cache = {}
+
+# user_id -> invalidate_config count; a read that began under an older count
+# may hold pre-save data, so it isn't stored
+_config_generations = {}
+_config_lock = threading.Lock()
+
+def invalidate_config(user_id):
+    """Forget cached settings and counts after a user's config, tokens, proxies, channels or servers change"""
+    with _config_lock:
+        _config_generations[user_id] = _config_generations.get(user_id, 0) + 1
+        _config_cache.pop(user_id, None)
+        _stats_cache.pop(user_id, None)
+    config_cache.invalidate(user_id)
+
+# The settings get_user_config returns, without the row's id and user_id
+CONFIG_COLUMNS = ('advertisement_message, interval_minutes, default_cooldown, '
+                  'use_proxies, keep_tokens_online, online_status')
+
 def get_user_config(user_id):
     conn = get_db()
-    config = conn.execute('SELECT * FROM user_configs WHERE user_id = ?', (user_id,)).fetchone()
-    conn.close()
+    config = conn.execute(f'SELECT {CONFIG_COLUMNS} FROM user_configs WHERE user_id = ?', (user_id,)).fetchone()
     
     if config:
         return dict(config)
-    else:
-        conn = get_db()
-        conn.execute('''INSERT INTO user_configs (user_id, advertisement_message, interval_minutes, 
-                        default_cooldown, use_proxies, keep_tokens_online, online_status)
-                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                     (user_id, '', 60, 60, 1, 1, 'online'))
-        conn.commit()
-        config = conn.execute('SELECT * FROM user_configs WHERE user_id = ?', (user_id,)).fetchone()
-        conn.close()
-        return dict(config)
+    
+    # Seed defaults and read the row back in one statement; the no-op update
+    # on conflict makes RETURNING yield the row a concurrent request inserted
+    with pool.writer() as conn:
+        config = conn.execute(f'''INSERT INTO user_configs (user_id, advertisement_message, interval_minutes, 
+                                 default_cooldown, use_proxies, keep_tokens_online, online_status)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?)
+                                 ON CONFLICT(user_id) DO UPDATE SET user_id = excluded.user_id
+                                 RETURNING {CONFIG_COLUMNS}''',
+                              (user_id, '', 60, 60, 1, 1, 'online')).fetchone()
+    return dict(config)
 
 def add_log(user_id, level, message, details=None):
-    conn = get_db()
-    conn.execute('INSERT INTO activity_logs (user_id, level, message, details) VALUES (?, ?, ?, ?)',
-                 (user_id, level, message, json.dumps(details) if details else None))
-    conn.commit()
-    
-    # Keep only last 100 logs per user
-    conn.execute('''DELETE FROM activity_logs WHERE id NOT IN (
-        SELECT id FROM activity_logs WHERE user_id = ? ORDER BY timestamp DESC LIMIT 100
-    ) AND user_id = ?''', (user_id, user_id))
-    conn.commit()
-    conn.close()
+    # Batched and pruned to the last 100 rows per user by the log buffer
+    log_buffer.add(user_id, level, message, orjson.dumps(details).decode() if details else None)
 
 def ensure_first_admin():
     """Make the first registered user an admin if no admins exist"""
-    conn = get_db()
-    
-    admin_count = conn.execute('SELECT COUNT(*) as count FROM users WHERE is_admin = 1').fetchone()['count']
-    
-    # Option 1: Check for ADMIN_USERNAME or ADMIN_EMAIL environment variable
-    admin_username = os.environ.get('ADMIN_USERNAME')
-    admin_email = os.environ.get('ADMIN_EMAIL')
-    
-    if admin_username or admin_email:
-        if admin_username:
-            user = conn.execute('SELECT id, username FROM users WHERE username = ?', (admin_username,)).fetchone()
-            if user and admin_count == 0:
-                conn.execute('UPDATE users SET is_admin = 1 WHERE id = ?', (user['id'],))
-                conn.commit()
-                print(f"✅ Made user '{user['username']}' an admin (via ADMIN_USERNAME env)")
+    with pool.writer() as conn:
+        admin_count = conn.execute('SELECT COUNT(*) as count FROM users WHERE is_admin = 1').fetchone()['count']
+        
+        # Option 1: Check for ADMIN_USERNAME or ADMIN_EMAIL environment variable
+        admin_username = os.environ.get('ADMIN_USERNAME')
+        admin_email = os.environ.get('ADMIN_EMAIL')
+        
+        if admin_username or admin_email:
+            if admin_username:
+                user = conn.execute('SELECT id, username FROM users WHERE username = ?', (admin_username,)).fetchone()
+                if user and admin_count == 0:
+                    conn.execute('UPDATE users SET is_admin = 1 WHERE id = ?', (user['id'],))
+                    invalidate_user(user['id'])
+                    print(f"✅ Made user '{user['username']}' an admin (via ADMIN_USERNAME env)")
         
-        if admin_email and admin_count == 0:
-            user = conn.execute('SELECT id, username FROM users WHERE email = ?', (admin_email,)).fetchone()
-            if user:
-                conn.execute('UPDATE users SET is_admin = 1 WHERE id = ?', (user['id'],))
-                conn.commit()
-                print(f"✅ Made user '{user['username']}' an admin (via ADMIN_EMAIL env)")
-    
-    # Option 2: Fallback to first user if no admin exists
-    if admin_count == 0:
-        first_user = conn.execute('SELECT id, username FROM users ORDER BY id LIMIT 1').fetchone()
-        if first_user:
-            conn.execute('UPDATE users SET is_admin = 1 WHERE id = ?', (first_user['id'],))
-            conn.commit()
-            print(f"✅ Made user '{first_user['username']}' (ID {first_user['id']}) an admin (first user)")
-    
-    conn.close()
+            if admin_email and admin_count == 0:
+                user = conn.execute('SELECT id, username FROM users WHERE email = ?', (admin_email,)).fetchone()
+                if user:
+                    conn.execute('UPDATE users SET is_admin = 1 WHERE id = ?', (user['id'],))
+                    invalidate_user(user['id'])
+                    print(f"✅ Made user '{user['username']}' an admin (via ADMIN_EMAIL env)")
+        
+        # Option 2: Fallback to first user if no admin exists
+        if admin_count == 0:
+            first_user = conn.execute('SELECT id, username FROM users ORDER BY id LIMIT 1').fetchone()
+            if first_user:
+                conn.execute('UPDATE users SET is_admin = 1 WHERE id = ?', (first_user['id'],))
+                invalidate_user(first_user['id'])
+                print(f"✅ Made user '{first_user['username']}' (ID {first_user['id']}) an admin (first user)")
 
 # ============================================================================
 # PAGE ROUTES
@@ -284,25 +531,14 @@ def signup_page():
 def admin_dashboard():
     return render_template('admin.html')
 
-@app.route('/admin/setup')
-def admin_setup_page():
-    """Quick admin setup page for first-time deployment"""
-    conn = get_db()
-    admin_count = conn.execute('SELECT COUNT(*) as count FROM users WHERE is_admin = 1').fetchone()['count']
-    user_count = conn.execute('SELECT COUNT(*) as count FROM users').fetchone()['count']
-    conn.close()
-    
-    # Only show if no admins exist
-    if admin_count > 0:
-        return redirect(url_for('admin_dashboard'))
-    
-    return f'''
+# Setup page markup, split around the only dynamic value (the user count)
+_SETUP_HTML_HEAD = '''
     <!DOCTYPE html>
     <html>
     <head>
         <title>Admin Setup</title>
         <style>
-            body {{
+            body {
                 font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif;
                 background: #0a0e14;
                 color: #e8eaed;
@@ -311,23 +547,23 @@ def admin_setup_page():
                 justify-content: center;
                 min-height: 100vh;
                 margin: 0;
-            }}
-            .container {{
+            }
+            .container {
                 background: #1e252e;
                 padding: 40px;
                 border-radius: 16px;
                 max-width: 500px;
                 box-shadow: 0 8px 32px rgba(0,0,0,0.5);
-            }}
-            h1 {{
+            }
+            h1 {
                 color: #00ff88;
                 margin: 0 0 20px 0;
-            }}
-            p {{
+            }
+            p {
                 color: #9ca3af;
                 margin: 10px 0;
-            }}
-            input {{
+            }
+            input {
                 width: 100%;
                 padding: 12px;
                 margin: 10px 0;
@@ -336,8 +572,8 @@ def admin_setup_page():
                 border-radius: 8px;
                 color: #e8eaed;
                 font-size: 15px;
-            }}
-            button {{
+            }
+            button {
                 width: 100%;
                 padding: 14px;
                 background: linear-gradient(135deg, #00ff88, #00d4ff);
@@ -348,32 +584,33 @@ def admin_setup_page():
                 font-size: 15px;
                 cursor: pointer;
                 margin-top: 20px;
-            }}
-            button:hover {{
+            }
+            button:hover {
                 opacity: 0.9;
-            }}
-            .success {{
+            }
+            .success {
                 background: rgba(0,255,136,0.1);
                 border: 1px solid #00ff88;
                 padding: 12px;
                 border-radius: 8px;
                 margin-top: 20px;
                 display: none;
-            }}
-            .error {{
+            }
+            .error {
                 background: rgba(255,68,102,0.1);
                 border: 1px solid #ff4466;
                 padding: 12px;
                 border-radius: 8px;
                 margin-top: 20px;
                 display: none;
-            }}
+            }
         </style>
     </head>
     <body>
         <div class="container">
             <h1>🛡️ Admin Setup</h1>
-            <p>No admin users exist yet. Total users: {user_count}</p>
+            <p>No admin users exist yet. Total users: '''
+_SETUP_HTML_TAIL = '''</p>
             <p>Enter your username to become admin:</p>
             
             <input type="text" id="username" placeholder="Enter your username" />
@@ -388,51 +625,63 @@ def admin_setup_page():
         </div>
         
         <script>
-            async function setupAdmin() {{
+            async function setupAdmin() {
                 const username = document.getElementById('username').value.trim();
-                if (!username) {{
+                if (!username) {
                     document.getElementById('errorMsg').textContent = 'Please enter your username';
                     document.getElementById('error').style.display = 'block';
                     return;
-                }}
+                }
                 
-                try {{
-                    const response = await fetch('/api/admin/quick-setup', {{
+                try {
+                    const response = await fetch('/api/admin/quick-setup', {
                         method: 'POST',
-                        headers: {{'Content-Type': 'application/json'}},
-                        body: JSON.stringify({{username}})
-                    }});
+                        headers: {'Content-Type': 'application/json'},
+                        body: JSON.stringify({username})
+                    });
                     
                     const data = await response.json();
                     
-                    if (data.success) {{
+                    if (data.success) {
                         document.getElementById('success').style.display = 'block';
                         document.getElementById('error').style.display = 'none';
-                    }} else {{
+                    } else {
                         document.getElementById('errorMsg').textContent = data.message || 'Failed to setup admin';
                         document.getElementById('error').style.display = 'block';
                         document.getElementById('success').style.display = 'none';
-                    }}
-                }} catch (error) {{
+                    }
+                } catch (error) {
                     document.getElementById('errorMsg').textContent = 'Connection error';
                     document.getElementById('error').style.display = 'block';
-                }}
-            }}
+                }
+            }
         </script>
     </body>
     </html>
     '''
 
+@app.route('/admin/setup')
+def admin_setup_page():
+    """Quick admin setup page for first-time deployment"""
+    user_count, admin_count = get_db().execute(
+        'SELECT COUNT(*), COALESCE(SUM(is_admin = 1), 0) FROM users').fetchone()
+    
+    # Only show if no admins exist
+    if admin_count > 0:
+        return redirect(url_for('admin_dashboard'))
+    
+    return _SETUP_HTML_HEAD + str(user_count) + _SETUP_HTML_TAIL
+
 # ============================================================================
 # AUTHENTICATION ROUTES
 # ============================================================================
 
 @app.route('/api/auth/signup', methods=['POST'])
 def signup():
-    data = request.json
-    username = data.get('username', '').strip()
-    email = data.get('email', '').strip()
-    password = data.get('password', '')
+    data = json_body()
+    username = str_field(data, 'username').strip()
+    email = str_field(data, 'email').strip()
+    password = str_field(data, 'password')
     
     if not username or not email or not password:
         return jsonify({'success': False, 'message': 'All fields are required'}), 400
@@ -443,74 +692,76 @@ def signup():
     if len(password) < 6:
         return jsonify({'success': False, 'message': 'Password must be at least 6 characters'}), 400
     
-    conn = get_db()
-    existing = conn.execute('SELECT id FROM users WHERE username = ? OR email = ?', 
-                           (username, email)).fetchone()
-    
-    if existing:
-        conn.close()
-        return jsonify({'success': False, 'message': 'Username or email already exists'}), 400
-    
-    password_hash = generate_password_hash(password)
+    password_hash = hash_password(password)
     try:
-        cursor = conn.execute('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)',
-                            (username, email, password_hash))
-        user_id = cursor.lastrowid
-        
-        conn.execute('INSERT INTO user_stats (user_id, total_sent) VALUES (?, 0)', (user_id,))
-        conn.commit()
-        conn.close()
+        with pool.writer() as conn:
+            # username and email are UNIQUE, so a taken one inserts nothing
+            cursor = conn.execute('INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?) ON CONFLICT DO NOTHING',
+                                (username, email, password_hash))
+            if cursor.rowcount == 0:
+                return jsonify({'success': False, 'message': 'Username or email already exists'}), 400
+            user_id = cursor.lastrowid
+            
+            conn.execute('INSERT INTO user_stats (user_id, total_sent) VALUES (?, 0)', (user_id,))
         
         return jsonify({'success': True, 'message': 'Account created successfully'})
     except Exception as e:
-        conn.close()
         return jsonify({'success': False, 'message': f'Error creating account: {str(e)}'}), 500
 
 @app.route('/api/auth/login', methods=['POST'])
 def login():
-    data = request.json
-    username = data.get('username', '').strip()
-    password = data.get('password', '')
+    data = json_body()
+    username = str_field(data, 'username').strip()
+    password = str_field(data, 'password')
     
     if not username or not password:
         return jsonify({'success': False, 'message': 'Username and password required'}), 400
     
+    # Both columns are UNIQUE, so SQLite serves the OR from their two indexes
     conn = get_db()
-    user = conn.execute('SELECT * FROM users WHERE username = ? OR email = ?', 
+    user = conn.execute('SELECT id, username, email, is_admin, password_hash FROM users WHERE username = ? OR email = ?', 
                        (username, username)).fetchone()
-    conn.close()
     
-    if not user or not check_password_hash(user['password_hash'], password):
+    if not user:
+        return jsonify({'success': False, 'message': 'Invalid username or password'}), 401
+    
+    uid, username, email, is_admin, password_hash = user
+    generation = _user_generations.get(uid, 0)
+    if not verify_password(password_hash, password):
         return jsonify({'success': False, 'message': 'Invalid username or password'}), 401
     
+    # Upgrade legacy werkzeug hashes now that we have the plaintext
+    if not password_hash.startswith('$2'):
+        with pool.writer() as conn:
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ?',
+                         (hash_password(password), uid))
+    
     session.permanent = True
-    session['user_id'] = user['id']
-    session['username'] = user['username']
-    session['is_admin'] = user['is_admin']
+    session['user_id'] = uid
+    
+    # Prime the profile cache for the /api/auth/current call that follows,
+    # unless the row changed while the password was being checked
+    profile = {'id': uid, 'username': username, 'email': email, 'is_admin': is_admin}
+    with _user_lock:
+        if _user_generations.get(uid, 0) == generation:
+            _user_cache[uid] = (profile, time.monotonic())
     
     return jsonify({
         'success': True,
         'message': 'Login successful',
-        'user': {
-            'id': user['id'],
-            'username': user['username'],
-            'email': user['email'],
-            'is_admin': user['is_admin']
-        }
+        'user': profile
     })
 
 @app.route('/api/auth/logout', methods=['POST'])
 def logout():
+    invalidate_user(session.get('user_id'))
     session.clear()
-    return jsonify({'success': True, 'message': 'Logged out successfully'})
+    return Response(LOGOUT_BODY, mimetype='application/json')
 
 @app.route('/api/auth/current', methods=['GET'])
 @login_required
 def current_user():
-    conn = get_db()
-    user = conn.execute('SELECT id, username, email, is_admin FROM users WHERE id = ?', 
-                       (session['user_id'],)).fetchone()
-    conn.close()
+    user = get_user_profile(session['user_id'])
     
     if user:
         return jsonify({
@@ -532,67 +783,84 @@ def current_user():
 @login_required
 def get_config():
     user_id = session['user_id']
-    config = get_user_config(user_id)
     
-    conn = get_db()
-    token_count = conn.execute('SELECT COUNT(*) as count FROM user_tokens WHERE user_id = ?', 
-                               (user_id,)).fetchone()['count']
-    proxy_count = conn.execute('SELECT COUNT(*) as count FROM user_proxies WHERE user_id = ?', 
-                               (user_id,)).fetchone()['count']
-    conn.close()
+    entry = _config_cache.get(user_id)
+    if entry and time.monotonic() - entry[1] < CONFIG_CACHE_TTL:
+        return jsonify(entry[0])
     
-    return jsonify({
-        'advertisement_message': config['advertisement_message'] or '',
-        'interval_minutes': config['interval_minutes'],
-        'default_cooldown': config['default_cooldown'],
-        'use_proxies': bool(config['use_proxies']),
-        'keep_tokens_online': bool(config['keep_tokens_online']),
-        'online_status': config['online_status'],
+    generation = _config_generations.get(user_id, 0)
+    
+    # Config and counts in a single round-trip
+    conn = get_db()
+    row = conn.execute('''
+        SELECT c.id, c.advertisement_message, c.interval_minutes, c.default_cooldown,
+               c.use_proxies, c.keep_tokens_online, c.online_status,
+               (SELECT COUNT(*) FROM user_tokens WHERE user_id = :uid) as token_count,
+               (SELECT COUNT(*) FROM user_proxies WHERE user_id = :uid) as proxy_count
+        FROM users u
+        LEFT JOIN user_configs c ON c.user_id = u.id
+        WHERE u.id = :uid
+    ''', {'uid': user_id}).fetchone()
+    
+    # The user was deleted while their session lived on
+    if row is None:
+        return account_gone()
+    
+    (config_id, message, interval_minutes, default_cooldown, use_proxies, keep_online, online_status,
+     token_count, proxy_count) = row
+    
+    # First visit: get_user_config creates the default config row
+    if config_id is None:
+        config = get_user_config(user_id)
+        message = config['advertisement_message']
+        interval_minutes = config['interval_minutes']
+        default_cooldown = config['default_cooldown']
+        use_proxies = config['use_proxies']
+        keep_online = config['keep_tokens_online']
+        online_status = config['online_status']
+    
+    payload = {
+        'advertisement_message': message or '',
+        'interval_minutes': interval_minutes,
+        'default_cooldown': default_cooldown,
+        'use_proxies': bool(use_proxies),
+        'keep_tokens_online': bool(keep_online),
+        'online_status': online_status,
         'token_count': token_count,
         'proxy_count': proxy_count
-    })
+    }
+    with _config_lock:
+        if _config_generations.get(user_id, 0) == generation:
+            _config_cache[user_id] = (payload, time.monotonic())
+    return jsonify(payload)
 
 @app.route('/api/config', methods=['POST'])
 @login_required
 def update_config():
     user_id = session['user_id']
-    data = request.json
-    
-    conn = get_db()
-    
-    updates = []
-    params = []
-    
-    if 'advertisement_message' in data:
-        updates.append('advertisement_message = ?')
-        params.append(data['advertisement_message'])
-    
-    if 'interval_minutes' in data:
-        updates.append('interval_minutes = ?')
-        params.append(int(data['interval_minutes']))
-    
-    if 'default_cooldown' in data:
-        updates.append('default_cooldown = ?')
-        params.append(int(data['default_cooldown']))
-    
-    if 'use_proxies' in data:
-        updates.append('use_proxies = ?')
-        params.append(1 if data['use_proxies'] else 0)
-    
-    if 'keep_tokens_online' in data:
-        updates.append('keep_tokens_online = ?')
-        params.append(1 if data['keep_tokens_online'] else 0)
-    
-    if 'online_status' in data:
-        updates.append('online_status = ?')
-        params.append(data['online_status'])
-    
-    if updates:
-        params.append(user_id)
-        conn.execute(f"UPDATE user_configs SET {', '.join(updates)} WHERE user_id = ?", params)
-        conn.commit()
-    
-    conn.close()
+    data = json_body()
+    
+    interval = data.get('interval_minutes')
+    cooldown = data.get('default_cooldown')
+    use_proxies = data.get('use_proxies')
+    keep_online = data.get('keep_tokens_online')
+    params = (
+        data.get('advertisement_message'),
+        to_int(interval, 'Interval') if interval is not None else None,
+        to_int(cooldown, 'Cooldown') if cooldown is not None else None,
+        (1 if use_proxies else 0) if use_proxies is not None else None,
+        (1 if keep_online else 0) if keep_online is not None else None,
+        data.get('online_status'),
+    )
+    
+    # Nothing recognized: skip the write transaction entirely
+    if all(p is None for p in params):
+        return jsonify({'success': True, 'message': 'Configuration updated'})
+    
+    with pool.writer() as conn:
+        conn.execute(UPDATE_CONFIG_SQL, params + (user_id,))
+    
+    invalidate_config(user_id)
     
     add_log(user_id, 'INFO', 'Configuration updated')
     return jsonify({'success': True, 'message': 'Configuration updated'})
@@ -605,33 +873,35 @@ def update_config():
 @login_required
 def get_tokens():
     user_id = session['user_id']
-    conn = get_db()
-    tokens = conn.execute('SELECT masked_token FROM user_tokens WHERE user_id = ?', 
-                         (user_id,)).fetchall()
-    conn.close()
-    
-    masked = [t['masked_token'] for t in tokens]
+    masked = fetch_column('SELECT masked_token FROM user_tokens WHERE user_id = ?', (user_id,))
     return jsonify({'tokens': masked, 'count': len(masked)})
 
 @app.route('/api/tokens', methods=['POST'])
 @login_required
 def update_tokens():
     user_id = session['user_id']
-    data = request.json
+    data = json_body()
     tokens = data.get('tokens', [])
+    if not isinstance(tokens, list) or not all(isinstance(item, str) for item in tokens):
+        bad_request('Tokens must be a list of strings')
     
-    valid_tokens = [t.strip() for t in tokens if len(t.strip()) > 20]
+    if len(tokens) > MAX_TOKENS:
+        return jsonify({'success': False, 'message': f'At most {MAX_TOKENS} tokens can be saved'}), 400
     
-    conn = get_db()
-    conn.execute('DELETE FROM user_tokens WHERE user_id = ?', (user_id,))
+    stripped = (t.strip() for t in tokens)
+    valid_tokens = [t for t in stripped if TOKEN_RE.fullmatch(t)]
     
-    for token in valid_tokens:
-        masked = mask_token(token)
-        conn.execute('INSERT INTO user_tokens (user_id, token, masked_token) VALUES (?, ?, ?)',
-                    (user_id, token, masked))
+    rows = [(user_id, token, mask_token(token)) for token in valid_tokens]
     
-    conn.commit()
-    conn.close()
+    try:
+        with pool.writer() as conn:
+            conn.execute('DELETE FROM user_tokens WHERE user_id = ?', (user_id,))
+            conn.executemany('INSERT INTO user_tokens (user_id, token, masked_token) VALUES (?, ?, ?)', rows)
+    except sqlite3.IntegrityError:
+        # Foreign keys reject rows for a user deleted while their session lived on
+        return account_gone()
+    
+    invalidate_config(user_id)
     
     add_log(user_id, 'INFO', f'Updated tokens', {'count': len(valid_tokens)})
     return jsonify({'success': True, 'message': f'Saved {len(valid_tokens)} tokens'})
@@ -640,12 +910,9 @@ def update_tokens():
 @login_required
 def get_raw_tokens():
     user_id = session['user_id']
-    conn = get_db()
-    tokens = conn.execute('SELECT token FROM user_tokens WHERE user_id = ?', 
-                         (user_id,)).fetchall()
-    conn.close()
+    tokens = fetch_column('SELECT token FROM user_tokens WHERE user_id = ?', (user_id,))
     
-    return jsonify({'tokens': [t['token'] for t in tokens]})
+    return jsonify({'tokens': tokens})
 
 # ============================================================================
 # PROXIES ROUTES
@@ -655,31 +922,36 @@ def get_raw_tokens():
 @login_required
 def get_proxies():
     user_id = session['user_id']
-    conn = get_db()
-    proxies = conn.execute('SELECT proxy FROM user_proxies WHERE user_id = ?', 
-                          (user_id,)).fetchall()
-    conn.close()
+    proxies = fetch_column('SELECT proxy FROM user_proxies WHERE user_id = ?', (user_id,))
     
-    return jsonify({'proxies': [p['proxy'] for p in proxies], 'count': len(proxies)})
+    return jsonify({'proxies': proxies, 'count': len(proxies)})
 
 @app.route('/api/proxies', methods=['POST'])
 @login_required
 def update_proxies():
     user_id = session['user_id']
-    data = request.json
+    data = json_body()
     proxies = data.get('proxies', [])
+    if not isinstance(proxies, list) or not all(isinstance(item, str) for item in proxies):
+        bad_request('Proxies must be a list of strings')
     
-    valid_proxies = [p.strip() for p in proxies if p.strip()]
+    if len(proxies) > MAX_PROXIES:
+        return jsonify({'success': False, 'message': f'At most {MAX_PROXIES} proxies can be saved'}), 400
     
-    conn = get_db()
-    conn.execute('DELETE FROM user_proxies WHERE user_id = ?', (user_id,))
+    # Drop blanks and repeats, keeping the order the user pasted them in
+    stripped = (p.strip() for p in proxies)
+    valid_proxies = list(dict.fromkeys(p for p in stripped if p))
     
-    for proxy in valid_proxies:
-        conn.execute('INSERT INTO user_proxies (user_id, proxy) VALUES (?, ?)',
-                    (user_id, proxy))
+    try:
+        with pool.writer() as conn:
+            conn.execute('DELETE FROM user_proxies WHERE user_id = ?', (user_id,))
+            conn.executemany('INSERT INTO user_proxies (user_id, proxy) VALUES (?, ?)',
+                             [(user_id, proxy) for proxy in valid_proxies])
+    except sqlite3.IntegrityError:
+        # Same foreign key failure as update_tokens
+        return account_gone()
     
-    conn.commit()
-    conn.close()
+    invalidate_config(user_id)
     
     add_log(user_id, 'INFO', f'Updated proxies', {'count': len(valid_proxies)})
     return jsonify({'success': True, 'message': f'Saved {len(valid_proxies)} proxies'})
@@ -692,21 +964,15 @@ def update_proxies():
 @login_required
 def get_channels():
     user_id = session['user_id']
-    conn = get_db()
-    channels = conn.execute('SELECT * FROM user_channels WHERE user_id = ? ORDER BY token_index, channel_id', 
-                           (user_id,)).fetchall()
-    conn.close()
+    cursor = fetch_tuples('SELECT token_index, channel_id, cooldown_minutes FROM user_channels WHERE user_id = ? ORDER BY token_index, channel_id',
+                          (user_id,))
     
     token_channels = {}
     channel_cooldowns = {}
     
-    for ch in channels:
-        token_idx = str(ch['token_index'])
-        if token_idx not in token_channels:
-            token_channels[token_idx] = []
-        
-        token_channels[token_idx].append(ch['channel_id'])
-        channel_cooldowns[ch['channel_id']] = ch['cooldown_minutes']
+    for token_idx, channel_id, cooldown in cursor:
+        token_channels.setdefault(str(token_idx), []).append(channel_id)
+        channel_cooldowns[channel_id] = cooldown
     
     return jsonify({
         'token_channels': token_channels,
@@ -717,24 +983,24 @@ def get_channels():
 @login_required
 def add_channel():
     user_id = session['user_id']
-    data = request.json
-    token_index = int(data.get('token_index'))
+    data = json_body()
+    token_index = to_int(data.get('token_index'), 'Token index')
+    cooldown = to_int(data.get('cooldown_minutes', 60), 'Cooldown')
     channel_id = str(data.get('channel_id'))
-    cooldown = int(data.get('cooldown_minutes', 60))
-    
-    conn = get_db()
-    
-    existing = conn.execute('SELECT id FROM user_channels WHERE user_id = ? AND token_index = ? AND channel_id = ?',
-                           (user_id, token_index, channel_id)).fetchone()
     
-    if existing:
-        conn.close()
+    # The unique index on (user_id, token_index, channel_id) rejects duplicates
+    try:
+        with pool.writer() as conn:
+            cursor = conn.execute('INSERT OR IGNORE INTO user_channels (user_id, token_index, channel_id, cooldown_minutes) VALUES (?, ?, ?, ?)',
+                                 (user_id, token_index, channel_id, cooldown))
+    except sqlite3.IntegrityError:
+        # Same foreign key failure as update_tokens
+        return account_gone()
+    
+    if cursor.rowcount == 0:
         return jsonify({'success': False, 'message': 'Channel already exists'})
     
-    conn.execute('INSERT INTO user_channels (user_id, token_index, channel_id, cooldown_minutes) VALUES (?, ?, ?, ?)',
-                (user_id, token_index, channel_id, cooldown))
-    conn.commit()
-    conn.close()
+    invalidate_config(user_id)
     
     add_log(user_id, 'INFO', f'Added channel {channel_id} to token {token_index}')
     return jsonify({'success': True, 'message': f'Channel added to token {token_index}'})
@@ -743,15 +1009,14 @@ def add_channel():
 @login_required
 def remove_channel():
     user_id = session['user_id']
-    data = request.json
-    token_index = int(data.get('token_index'))
+    data = json_body()
+    token_index = to_int(data.get('token_index'), 'Token index')
     channel_id = str(data.get('channel_id'))
     
-    conn = get_db()
-    conn.execute('DELETE FROM user_channels WHERE user_id = ? AND token_index = ? AND channel_id = ?',
-                (user_id, token_index, channel_id))
-    conn.commit()
-    conn.close()
+    with pool.writer() as conn:
+        conn.execute('DELETE FROM user_channels WHERE user_id = ? AND token_index = ? AND channel_id = ?',
+                    (user_id, token_index, channel_id))
+    invalidate_config(user_id)
     
     add_log(user_id, 'INFO', f'Removed channel {channel_id} from token {token_index}')
     return jsonify({'success': True, 'message': 'Channel removed'})
@@ -760,15 +1025,13 @@ def remove_channel():
 @login_required
 def set_channel_cooldown():
     user_id = session['user_id']
-    data = request.json
+    data = json_body()
     channel_id = str(data.get('channel_id'))
-    cooldown = int(data.get('cooldown_minutes'))
+    cooldown = to_int(data.get('cooldown_minutes'), 'Cooldown')
     
-    conn = get_db()
-    conn.execute('UPDATE user_channels SET cooldown_minutes = ? WHERE user_id = ? AND channel_id = ?',
-                (cooldown, user_id, channel_id))
-    conn.commit()
-    conn.close()
+    with pool.writer() as conn:
+        conn.execute('UPDATE user_channels SET cooldown_minutes = ? WHERE user_id = ? AND channel_id = ?',
+                    (cooldown, user_id, channel_id))
     
     return jsonify({'success': True, 'message': f'Cooldown set to {cooldown} minutes'})
 
@@ -780,33 +1043,30 @@ def set_channel_cooldown():
 @login_required
 def get_servers():
     user_id = session['user_id']
-    conn = get_db()
-    servers = conn.execute('SELECT server_id FROM user_servers WHERE user_id = ?', 
-                          (user_id,)).fetchall()
-    conn.close()
+    servers = fetch_column('SELECT server_id FROM user_servers WHERE user_id = ?', (user_id,))
     
-    return jsonify({'servers': [s['server_id'] for s in servers]})
+    return jsonify({'servers': servers})
 
 @app.route('/api/servers/add', methods=['POST'])
 @login_required
 def add_server():
     user_id = session['user_id']
-    data = request.json
+    data = json_body()
     server_id = str(data.get('server_id'))
     
-    conn = get_db()
-    
-    existing = conn.execute('SELECT id FROM user_servers WHERE user_id = ? AND server_id = ?',
-                           (user_id, server_id)).fetchone()
-    
-    if existing:
-        conn.close()
+    # The unique index on (user_id, server_id) rejects duplicates
+    try:
+        with pool.writer() as conn:
+            cursor = conn.execute('INSERT OR IGNORE INTO user_servers (user_id, server_id) VALUES (?, ?)',
+                                 (user_id, server_id))
+    except sqlite3.IntegrityError:
+        # Same foreign key failure as update_tokens
+        return account_gone()
+    
+    if cursor.rowcount == 0:
         return jsonify({'success': False, 'message': 'Server already exists'})
     
-    conn.execute('INSERT INTO user_servers (user_id, server_id) VALUES (?, ?)',
-                (user_id, server_id))
-    conn.commit()
-    conn.close()
+    invalidate_config(user_id)
     
     add_log(user_id, 'INFO', f'Added server {server_id}')
     return jsonify({'success': True, 'message': 'Server added'})
@@ -815,14 +1075,13 @@ def add_server():
 @login_required
 def remove_server():
     user_id = session['user_id']
-    data = request.json
+    data = json_body()
     server_id = str(data.get('server_id'))
     
-    conn = get_db()
-    conn.execute('DELETE FROM user_servers WHERE user_id = ? AND server_id = ?',
-                (user_id, server_id))
-    conn.commit()
-    conn.close()
+    with pool.writer() as conn:
+        conn.execute('DELETE FROM user_servers WHERE user_id = ? AND server_id = ?',
+                    (user_id, server_id))
+    invalidate_config(user_id)
     
     add_log(user_id, 'INFO', f'Removed server {server_id}')
     return jsonify({'success': True, 'message': 'Server removed'})
@@ -831,41 +1090,62 @@ def remove_server():
 # STATS ROUTES
 # ============================================================================
 
+def load_stats(user_id):
+    """Stats, counts and config for /api/stats, cached for STATS_CACHE_TTL; None if the user is gone"""
+    entry = _stats_cache.get(user_id)
+    if entry and time.monotonic() - entry[1] < STATS_CACHE_TTL:
+        return entry[0]
+    
+    generation = _config_generations.get(user_id, 0)
+    today = utc_today()
+    week_ago = (datetime.now(timezone.utc) - timedelta(days=7)).strftime('%Y-%m-%d')
+    
+    # Stats, counts and config in a single round-trip
+    row = get_db().execute('''
+        SELECT s.total_sent, s.last_activity,
+               (SELECT COUNT(*) FROM user_tokens WHERE user_id = :uid) as token_count,
+               (SELECT COUNT(*) FROM user_channels WHERE user_id = :uid) as channel_count,
+               (SELECT COUNT(*) FROM user_servers WHERE user_id = :uid) as server_count,
+               (SELECT COUNT(*) FROM user_proxies WHERE user_id = :uid) as proxy_count,
+               (SELECT COUNT(*) FROM activity_logs
+                WHERE user_id = :uid AND level = 'SUCCESS' AND timestamp LIKE :today) as messages_today,
+               (SELECT COUNT(*) FROM activity_logs
+                WHERE user_id = :uid AND level = 'SUCCESS' AND timestamp >= :week_ago) as messages_week,
+               c.interval_minutes, c.use_proxies, c.keep_tokens_online, c.online_status
+        FROM users u
+        LEFT JOIN user_stats s ON s.user_id = u.id
+        LEFT JOIN user_configs c ON c.user_id = u.id
+        WHERE u.id = :uid
+    ''', {'uid': user_id, 'today': f'{today}%', 'week_ago': week_ago}).fetchone()
+    
+    # The user was deleted while their session lived on
+    if row is None:
+        return None
+    stats = tuple(row)
+    
+    # First visit: get_user_config creates the default config row
+    if stats[8] is None:
+        config = get_user_config(user_id)
+        stats = stats[:8] + (config['interval_minutes'], config['use_proxies'],
+                             config['keep_tokens_online'], config['online_status'])
+    
+    # Skip the store if a save invalidated this user mid-read
+    with _config_lock:
+        if _config_generations.get(user_id, 0) == generation:
+            _stats_cache[user_id] = (stats, time.monotonic())
+    return stats
+
 @app.route('/api/stats', methods=['GET'])
 @login_required
 def get_stats():
     user_id = session['user_id']
     
-    conn = get_db()
-    
-    stats = conn.execute('SELECT * FROM user_stats WHERE user_id = ?', (user_id,)).fetchone()
-    
-    token_count = conn.execute('SELECT COUNT(*) as count FROM user_tokens WHERE user_id = ?', 
-                               (user_id,)).fetchone()['count']
-    channel_count = conn.execute('SELECT COUNT(*) as count FROM user_channels WHERE user_id = ?', 
-                                 (user_id,)).fetchone()['count']
-    server_count = conn.execute('SELECT COUNT(*) as count FROM user_servers WHERE user_id = ?', 
-                                (user_id,)).fetchone()['count']
-    proxy_count = conn.execute('SELECT COUNT(*) as count FROM user_proxies WHERE user_id = ?', 
-                               (user_id,)).fetchone()['count']
-    
-    # Get messages sent today
-    today = datetime.now().strftime('%Y-%m-%d')
-    messages_today = conn.execute(
-        "SELECT COUNT(*) as count FROM activity_logs WHERE user_id = ? AND level = 'SUCCESS' AND timestamp LIKE ?",
-        (user_id, f'{today}%')
-    ).fetchone()['count']
+    stats = load_stats(user_id)
+    if stats is None:
+        return account_gone()
     
-    # Get messages sent this week
-    week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-    messages_week = conn.execute(
-        "SELECT COUNT(*) as count FROM activity_logs WHERE user_id = ? AND level = 'SUCCESS' AND timestamp >= ?",
-        (user_id, week_ago)
-    ).fetchone()['count']
-    
-    config = get_user_config(user_id)
-    
-    conn.close()
+    (total_sent, last_activity, token_count, channel_count, server_count, proxy_count,
+     messages_today, messages_week, interval_minutes, use_proxies, keep_online, online_status) = stats
     
     # Get advertiser status
     advertiser_status = advertiser_service.get_user_status(user_id)
@@ -880,7 +1160,7 @@ def get_stats():
             uptime_seconds = 0
     
     return jsonify({
-        'total_sent': stats['total_sent'] if stats else 0,
+        'total_sent': total_sent or 0,
         'active_tokens': advertiser_status['active_tokens'],
         'total_tokens': token_count,
         'total_channels': channel_count,
@@ -889,30 +1169,21 @@ def get_stats():
         'uptime_seconds': uptime_seconds,
         'messages_today': messages_today,
         'messages_week': messages_week,
-        'last_activity': stats['last_activity'] if stats and stats['last_activity'] else None,
-        'interval_minutes': config['interval_minutes'],
-        'use_proxies': bool(config['use_proxies']),
-        'keep_online': bool(config['keep_tokens_online']),
-        'online_status': config['online_status']
+        'last_activity': last_activity or None,
+        'interval_minutes': interval_minutes,
+        'use_proxies': bool(use_proxies),
+        'keep_online': bool(keep_online),
+        'online_status': online_status
     })
 
 @app.route('/api/stats/increment', methods=['POST'])
 @login_required
 def increment_stats():
     user_id = session['user_id']
-    data = request.json
-    
-    conn = get_db()
-    
-    if 'total_sent' in data:
-        conn.execute('UPDATE user_stats SET total_sent = total_sent + ?, last_activity = CURRENT_TIMESTAMP WHERE user_id = ?',
-                    (data['total_sent'], user_id))
-    else:
-        conn.execute('UPDATE user_stats SET last_activity = CURRENT_TIMESTAMP WHERE user_id = ?',
-                    (user_id,))
+    data = json_body()
     
-    conn.commit()
-    conn.close()
+    # Written by the stats buffer within STATS_FLUSH_INTERVAL
+    stats_buffer.add(user_id, to_int(data.get('total_sent', 0), 'Total sent'))
     
     return jsonify({'success': True})
 
@@ -925,25 +1196,24 @@ def increment_stats():
 def get_logs():
     user_id = session['user_id']
     
-    conn = get_db()
-    logs = conn.execute('SELECT * FROM activity_logs WHERE user_id = ? ORDER BY timestamp DESC LIMIT 100',
-                       (user_id,)).fetchall()
-    conn.close()
+    logs = fetch_tuples('SELECT timestamp, level, message, details FROM activity_logs WHERE user_id = ? ORDER BY timestamp DESC LIMIT 100',
+                        (user_id,))
     
-    return jsonify({
+    # details are stored as JSON text; embed them as-is instead of re-parsing
+    return conditional(Response(orjson.dumps({
         'logs': [{
-            'timestamp': log['timestamp'],
-            'level': log['level'],
-            'message': log['message'],
-            'details': json.loads(log['details']) if log['details'] else {}
-        } for log in logs]
-    })
+            'timestamp': timestamp,
+            'level': level,
+            'message': message,
+            'details': orjson.Fragment(details or '{}')
+        } for timestamp, level, message, details in logs]
+    }), mimetype='application/json'))
 
 @app.route('/api/logs/add', methods=['POST'])
 @login_required
 def add_log_api():
     user_id = session['user_id']
-    data = request.json
+    data = json_body()
     
     add_log(user_id, data.get('level', 'INFO'), data.get('message', ''), data.get('details'))
     
@@ -985,7 +1255,8 @@ def stop_advertiser():
     user_id = session['user_id']
     
     try:
-        run_async(advertiser_service.stop_user_advertiser(user_id))
+        # The advertiser winds down on the loop; no need to hold this thread
+        submit_async(advertiser_service.stop_user_advertiser(user_id))
         
         add_log(user_id, 'INFO', 'Advertiser stopped')
         return jsonify({
@@ -1006,16 +1277,16 @@ def get_advertiser_status():
     try:
         status = advertiser_service.get_user_status(user_id)
         
-        # Get messages sent today from database
-        conn = get_db()
-        today = datetime.now().strftime('%Y-%m-%d')
-        logs_today = conn.execute(
-            "SELECT COUNT(*) as count FROM activity_logs WHERE user_id = ? AND level = 'SUCCESS' AND timestamp LIKE ?",
-            (user_id, f'{today}%')
-        ).fetchone()
-        conn.close()
-        
-        status['messages_today'] = logs_today['count'] if logs_today else 0
+        # Running advertisers keep their own count; otherwise ask the database
+        if 'messages_today' not in status:
+            today = utc_today()
+            conn = get_db()
+            logs_today = conn.execute(
+                "SELECT COUNT(*) as count FROM activity_logs WHERE user_id = ? AND level = 'SUCCESS' AND timestamp LIKE ?",
+                (user_id, f'{today}%')
+            ).fetchone()
+            
+            status['messages_today'] = logs_today['count'] if logs_today else 0
         
         return jsonify({
             'success': True,
@@ -1034,32 +1305,28 @@ def get_advertiser_status():
 @app.route('/api/admin/quick-setup', methods=['POST'])
 def admin_quick_setup():
     """Quick admin setup route - only works if no admins exist"""
-    data = request.json
-    username = data.get('username', '').strip()
+    data = json_body()
+    username = str_field(data, 'username').strip()
     
     if not username:
         return jsonify({'success': False, 'message': 'Username required'}), 400
     
-    conn = get_db()
-    
-    # Check if any admin exists
-    admin_count = conn.execute('SELECT COUNT(*) as count FROM users WHERE is_admin = 1').fetchone()['count']
-    
-    if admin_count > 0:
-        conn.close()
-        return jsonify({'success': False, 'message': 'Admin already exists'}), 403
-    
-    # Find user by username
-    user = conn.execute('SELECT id, username FROM users WHERE username = ?', (username,)).fetchone()
-    
-    if not user:
-        conn.close()
-        return jsonify({'success': False, 'message': 'User not found. Please sign up first.'}), 404
-    
-    # Make user admin
-    conn.execute('UPDATE users SET is_admin = 1 WHERE id = ?', (user['id'],))
-    conn.commit()
-    conn.close()
+    with pool.writer() as conn:
+        # Check if any admin exists
+        admin_count = conn.execute('SELECT COUNT(*) as count FROM users WHERE is_admin = 1').fetchone()['count']
+        
+        if admin_count > 0:
+            return jsonify({'success': False, 'message': 'Admin already exists'}), 403
+        
+        # Find user by username
+        user = conn.execute('SELECT id, username FROM users WHERE username = ?', (username,)).fetchone()
+        
+        if not user:
+            return jsonify({'success': False, 'message': 'User not found. Please sign up first.'}), 404
+        
+        # Make user admin
+        conn.execute('UPDATE users SET is_admin = 1 WHERE id = ?', (user['id'],))
+    invalidate_user(user['id'])
     
     return jsonify({
         'success': True,
@@ -1069,141 +1336,153 @@ def admin_quick_setup():
 @app.route('/api/admin/stats/overview', methods=['GET'])
 @admin_required
 def admin_overview():
-    conn = get_db()
-    
-    total_users = conn.execute('SELECT COUNT(*) as count FROM users').fetchone()['count']
-    
-    # Active users (last 24 hours)
-    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
-    active_users = conn.execute(
-        'SELECT COUNT(DISTINCT user_id) as count FROM user_stats WHERE last_activity > ?',
-        (yesterday,)
-    ).fetchone()['count']
-    
-    # Recent signups (last 7 days)
-    week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
-    recent_signups = conn.execute(
-        'SELECT COUNT(*) as count FROM users WHERE created_at > ?',
-        (week_ago,)
-    ).fetchone()['count']
-    
-    # Total messages
-    total_messages = conn.execute('SELECT SUM(total_sent) as sum FROM user_stats').fetchone()['sum'] or 0
-    
-    # Total tokens
-    total_tokens = conn.execute('SELECT COUNT(*) as count FROM user_tokens').fetchone()['count']
-    
-    # Total channels
-    total_channels = conn.execute('SELECT COUNT(*) as count FROM user_channels').fetchone()['count']
-    
-    conn.close()
+    # Totals are shared by every admin poll; only the running count is live
+    entry = _overview_cache.get('totals')
+    if entry and time.monotonic() - entry[1] < OVERVIEW_CACHE_TTL:
+        totals = entry[0]
+    else:
+        yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        week_ago = (datetime.now(timezone.utc) - timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
+        
+        # All six aggregates in a single round-trip
+        (total_users, active_users, recent_signups,
+         total_messages, total_tokens, total_channels) = get_db().execute('''
+            SELECT (SELECT COUNT(*) FROM users),
+                   (SELECT COUNT(DISTINCT user_id) FROM user_stats WHERE last_activity > :yesterday),
+                   (SELECT COUNT(*) FROM users WHERE created_at > :week_ago),
+                   (SELECT COALESCE(SUM(total_sent), 0) FROM user_stats),
+                   (SELECT COUNT(*) FROM user_tokens),
+                   (SELECT COUNT(*) FROM user_channels)
+        ''', {'yesterday': yesterday, 'week_ago': week_ago}).fetchone()
+        
+        totals = {
+            'total_users': total_users,
+            'active_users': active_users,
+            'recent_signups': recent_signups,
+            'total_messages': total_messages,
+            'total_tokens': total_tokens,
+            'total_channels': total_channels
+        }
+        _overview_cache['totals'] = (totals, time.monotonic())
     
     # Running advertisers
-    running_advertisers = len([uid for uid, adv in advertiser_service.advertisers.items() if adv.running])
+    running_advertisers = sum(1 for adv in list(advertiser_service.user_advertisers.values()) if adv.running)
     
-    return jsonify({
-        'total_users': total_users,
-        'active_users': active_users,
-        'recent_signups': recent_signups,
-        'total_messages': total_messages,
-        'total_tokens': total_tokens,
-        'total_channels': total_channels,
-        'running_advertisers': running_advertisers
-    })
+    return jsonify({**totals, 'running_advertisers': running_advertisers})
 
 @app.route('/api/admin/users', methods=['GET'])
 @admin_required
 def admin_users():
-    conn = get_db()
+    # Optional keyset paging: ?after_id=<last id seen>&limit=N (no limit by default)
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = request.args.get('limit', -1, type=int)
     
-    users = conn.execute('''
-        SELECT u.*, 
+    # Counts come from one grouped pass per table rather than two subqueries per user
+    users = fetch_tuples('''
+        SELECT u.id, u.username, u.email, u.is_admin, u.created_at,
                COALESCE(s.total_sent, 0) as total_sent,
                s.last_activity,
-               (SELECT COUNT(*) FROM user_tokens WHERE user_id = u.id) as token_count,
-               (SELECT COUNT(*) FROM user_channels WHERE user_id = u.id) as channel_count
+               COALESCE(t.count, 0) as token_count,
+               COALESCE(c.count, 0) as channel_count
         FROM users u
         LEFT JOIN user_stats s ON u.id = s.user_id
+        LEFT JOIN (SELECT user_id, COUNT(*) as count FROM user_tokens GROUP BY user_id) t ON t.user_id = u.id
+        LEFT JOIN (SELECT user_id, COUNT(*) as count FROM user_channels GROUP BY user_id) c ON c.user_id = u.id
+        WHERE u.id > ?
         ORDER BY u.id
-    ''').fetchall()
+        LIMIT ?
+    ''', (after_id, limit))
     
-    conn.close()
+    # One pass over the running advertisers instead of a lookup per user
+    statuses = advertiser_service.get_all_statuses()
+    idle = {'running': False, 'active_tokens': 0}
     
     user_list = []
-    for user in users:
-        advertiser_status = advertiser_service.get_user_status(user['id'])
+    for (uid, username, email, is_admin, created_at, total_sent, last_activity,
+         token_count, channel_count) in users:
+        advertiser_status = statuses.get(uid, idle)
         
         user_list.append({
-            'id': user['id'],
-            'username': user['username'],
-            'email': user['email'],
-            'is_admin': bool(user['is_admin']),
-            'created_at': user['created_at'],
-            'total_sent': user['total_sent'],
-            'last_activity': user['last_activity'],
-            'token_count': user['token_count'],
-            'channel_count': user['channel_count'],
+            'id': uid,
+            'username': username,
+            'email': email,
+            'is_admin': bool(is_admin),
+            'created_at': created_at,
+            'total_sent': total_sent,
+            'last_activity': last_activity,
+            'token_count': token_count,
+            'channel_count': channel_count,
             'advertiser_running': advertiser_status['running'],
             'active_tokens': advertiser_status['active_tokens']
         })
     
     return jsonify({'users': user_list})
 
+# Column order of the channel rows returned by admin_user_details
+CHANNEL_FIELDS = ('id', 'user_id', 'token_index', 'channel_id', 'cooldown_minutes', 'added_at')
+
 @app.route('/api/admin/user/<int:user_id>', methods=['GET'])
 @admin_required
 def admin_user_details(user_id):
-    conn = get_db()
-    
-    user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
+    # User, stats and config in one row; the three lists follow on the same connection
+    user = fetch_tuples('''
+        SELECT u.id, u.username, u.email, u.is_admin, u.created_at,
+               s.total_sent, s.last_activity,
+               c.id, c.interval_minutes, c.default_cooldown, c.use_proxies,
+               LENGTH(COALESCE(c.advertisement_message, ''))
+        FROM users u
+        LEFT JOIN user_stats s ON s.user_id = u.id
+        LEFT JOIN user_configs c ON c.user_id = u.id
+        WHERE u.id = ?
+    ''', (user_id,)).fetchone()
     if not user:
-        conn.close()
         return jsonify({'error': 'User not found'}), 404
     
-    stats = conn.execute('SELECT * FROM user_stats WHERE user_id = ?', (user_id,)).fetchone()
-    config = conn.execute('SELECT * FROM user_configs WHERE user_id = ?', (user_id,)).fetchone()
+    (uid, username, email, is_admin, created_at, total_sent, last_activity,
+     config_id, interval_minutes, default_cooldown, use_proxies, message_length) = user
+    has_config = config_id is not None
     
-    tokens = conn.execute('SELECT masked_token FROM user_tokens WHERE user_id = ?', (user_id,)).fetchall()
-    channels = conn.execute('SELECT * FROM user_channels WHERE user_id = ?', (user_id,)).fetchall()
+    tokens = fetch_column('SELECT masked_token FROM user_tokens WHERE user_id = ?', (user_id,))
+    channels = fetch_tuples('''SELECT id, user_id, token_index, channel_id, cooldown_minutes, added_at
+                               FROM user_channels WHERE user_id = ?''', (user_id,))
     
-    recent_logs = conn.execute(
-        'SELECT * FROM activity_logs WHERE user_id = ? ORDER BY timestamp DESC LIMIT 20',
+    recent_logs = fetch_tuples(
+        'SELECT timestamp, level, message FROM activity_logs WHERE user_id = ? ORDER BY timestamp DESC LIMIT 20',
         (user_id,)
-    ).fetchall()
-    
-    conn.close()
+    )
     
     return jsonify({
         'user': {
-            'id': user['id'],
-            'username': user['username'],
-            'email': user['email'],
-            'is_admin': bool(user['is_admin']),
-            'created_at': user['created_at']
+            'id': uid,
+            'username': username,
+            'email': email,
+            'is_admin': bool(is_admin),
+            'created_at': created_at
         },
         'stats': {
-            'total_sent': stats['total_sent'] if stats else 0,
-            'last_activity': stats['last_activity'] if stats else None
+            'total_sent': total_sent or 0,
+            'last_activity': last_activity
         },
         'config': {
-            'interval_minutes': config['interval_minutes'] if config else 60,
-            'default_cooldown': config['default_cooldown'] if config else 60,
-            'use_proxies': bool(config['use_proxies']) if config else False,
-            'message_length': len(config['advertisement_message'] or '') if config else 0
+            'interval_minutes': interval_minutes if has_config else 60,
+            'default_cooldown': default_cooldown if has_config else 60,
+            'use_proxies': bool(use_proxies) if has_config else False,
+            'message_length': message_length if has_config else 0
         },
-        'tokens': [t['masked_token'] for t in tokens],
-        'channels': [dict(c) for c in channels],
+        'tokens': tokens,
+        'channels': [dict(zip(CHANNEL_FIELDS, c)) for c in channels],
         'recent_logs': [{
-            'timestamp': log['timestamp'],
-            'level': log['level'],
-            'message': log['message']
-        } for log in recent_logs]
+            'timestamp': timestamp,
+            'level': level,
+            'message': message
+        } for timestamp, level, message in recent_logs]
     })
 
 @app.route('/api/admin/user/<int:user_id>/stop-advertiser', methods=['POST'])
 @admin_required
 def admin_stop_user_advertiser(user_id):
     try:
-        run_async(advertiser_service.stop_user_advertiser(user_id))
+        submit_async(advertiser_service.stop_user_advertiser(user_id))
         return jsonify({'success': True, 'message': 'Advertiser stopped'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -1216,11 +1495,9 @@ def admin_delete_user(user_id):
     user = conn.execute('SELECT is_admin FROM users WHERE id = ?', (user_id,)).fetchone()
     
     if not user:
-        conn.close()
         return jsonify({'success': False, 'error': 'User not found'}), 404
     
     if user['is_admin']:
-        conn.close()
         return jsonify({'success': False, 'error': 'Cannot delete admin users'}), 403
     
     # Stop advertiser first
@@ -1230,53 +1507,50 @@ def admin_delete_user(user_id):
         pass
     
     # Delete user (CASCADE will handle related tables)
-    conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    with pool.writer() as conn:
+        conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
+    invalidate_config(user_id)
+    invalidate_user(user_id)
     
     return jsonify({'success': True, 'message': 'User deleted successfully'})
 
 @app.route('/api/admin/activity/recent', methods=['GET'])
 @admin_required
 def admin_recent_activity():
-    limit = int(request.args.get('limit', 50))
+    limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_ACTIVITY_LIMIT)
     
-    conn = get_db()
-    logs = conn.execute('''
-        SELECT a.*, u.username
+    logs = fetch_tuples('''
+        SELECT u.username, a.level, a.message, a.timestamp
         FROM activity_logs a
         JOIN users u ON a.user_id = u.id
         ORDER BY a.timestamp DESC
         LIMIT ?
-    ''', (limit,)).fetchall()
-    conn.close()
+    ''', (limit,))
     
-    return jsonify({
+    return conditional(jsonify({
         'logs': [{
-            'username': log['username'],
-            'level': log['level'],
-            'message': log['message'],
-            'timestamp': log['timestamp']
-        } for log in logs]
-    })
+            'username': username,
+            'level': level,
+            'message': message,
+            'timestamp': timestamp
+        } for username, level, message, timestamp in logs]
+    }))
 
 @app.route('/api/admin/system/info', methods=['GET'])
 @admin_required
 def admin_system_info():
-    # Get database size
-    db_size = 0
-    try:
-        db_size = os.path.getsize('advertiser.db')
-    except:
-        pass
+    # Get database size: pages in the main file plus the WAL sidecar files
+    conn = get_db()
+    page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    db_size = page_count * page_size
+    for suffix in ('-wal', '-shm'):
+        try:
+            db_size += os.path.getsize(DB_PATH + suffix)
+        except OSError:
+            pass
     
-    return jsonify({
-        'python_version': sys.version.split()[0],
-        'platform': platform.system(),
-        'platform_release': platform.release(),
-        'database_size': db_size,
-        'flask_debug': app.debug
-    })
+    return jsonify({**SYSTEM_INFO, 'database_size': db_size, 'flask_debug': app.debug})
 
 # ============================================================================
 # MAIN